@@ -1,10 +1,11 @@
 import streamlit as st
+from streamlit_autorefresh import st_autorefresh
 import numpy as np
-import random
+from scipy import ndimage
 import time
-from collections import deque
+import threading
+from numba import njit
 import gspread
-import pandas as pd
 from google.oauth2.service_account import Credentials
 
 # --- ゲームの設定 ---
@@ -19,10 +20,23 @@ EXIT_LOCKED = "🚪"
 EXIT_UNLOCKED = "🟩"
 OBSTACLE = "🌲"
 TRAP = "🪤"
+# タイルID (uint8)。マップはIDの配列として保持し、絵文字は描画時にTILE_LUT経由でのみ使う
+FLOOR_ID = 0
+WALL_ID = 1
+OBSTACLE_ID = 2
+PLAYER_ID = 3
+ONI_ID = 4
+KEY_ID = 5
+EXIT_LOCKED_ID = 6
+EXIT_UNLOCKED_ID = 7
+TRAP_ID = 8
+TILE_LUT = np.array([FLOOR, WALL, OBSTACLE, PLAYER, ONI, KEY, EXIT_LOCKED, EXIT_UNLOCKED, TRAP], dtype='<U2')
 INITIAL_PLAYER_POS = [1, 1]
 EXIT_POS = [MAP_WIDTH - 2, 1] # [16, 1]
+RNG = np.random.default_rng()  # 乱数はセッション共通のGeneratorを使う
 
 # --- Google Sheets 連携 ---
+@st.cache_resource # 認証済みクライアントはセッションをまたいで使い回す
 def get_gspread_client():
     """StreamlitのSecretから認証情報を取得し、gspreadクライアントを返す"""
     try:
@@ -39,95 +53,100 @@ def get_ranking(_client):
     try:
         spreadsheet_key = st.secrets.spreadsheet_key
         sheet = _client.open_by_key(spreadsheet_key).sheet1
-        records = sheet.get_all_records()
-        if not records:
-            return pd.DataFrame(columns=['Name', 'Difficulty', 'ClearCount'])
-            
-        df = pd.DataFrame(records)
-        df['ClearCount'] = pd.to_numeric(df['ClearCount'])
-        top_scores = df.loc[df.groupby('Name')['ClearCount'].idxmax()]
-        ranking = top_scores.sort_values(by='ClearCount', ascending=False).head(5)
-        return ranking[['Name', 'Difficulty', 'ClearCount']]
+        rows = sheet.values_get('Sheet1!A:D').get('values', [])
+        data = [r[:3] for r in rows[1:] if len(r) >= 3]  # ヘッダ行を除く
+        if not data:
+            return []
+
+        arr = np.array(data, dtype=object)
+        names = arr[:, 0].astype(str)
+        counts = arr[:, 2].astype(np.int32)
+        # プレイヤーごとの最高記録行: 名前→回数でソートし、各グループの末尾を取る
+        uniq_names, inverse = np.unique(names, return_inverse=True)
+        order = np.lexsort((counts, inverse))
+        group_last = np.searchsorted(inverse[order], np.arange(len(uniq_names)), side='right') - 1
+        best_rows = order[group_last]
+        best_counts = counts[best_rows]
+        # 上位5件だけを部分選択してからソートする
+        k = min(5, len(best_rows))
+        top = np.argpartition(-best_counts, k - 1)[:k]
+        top = top[np.argsort(-best_counts[top], kind='stable')]
+        return [{'Name': arr[i, 0], 'Difficulty': arr[i, 1], 'ClearCount': int(counts[i])}
+                for i in best_rows[top]]
     except Exception as e:
         st.sidebar.warning(f"ランキング取得エラー: {e}")
-        return pd.DataFrame()
+        return []
+
+def _flush_scores(sheet, batch, pending):
+    """溜まったスコアをバックグラウンドで一括送信する"""
+    try:
+        sheet.values_append('Sheet1!A:D',
+                            {'valueInputOption': 'USER_ENTERED'},
+                            {'values': batch})
+    except Exception:
+        pending.extend(batch)  # 送信失敗分は次回の保存時にまとめて再送する
 
 def save_score(client, name, difficulty, clear_count):
-    """スコアをスプレッドシートに保存"""
+    """スコアをバッファに積み、スプレッドシートへ非同期で保存"""
     try:
         spreadsheet_key = st.secrets.spreadsheet_key
         sheet = client.open_by_key(spreadsheet_key).sheet1
         timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-        sheet.append_row([name, difficulty, clear_count, timestamp])
-        st.cache_data.clear() # スコア保存後にキャッシュをクリア
+        if '_pending_scores' not in st.session_state:
+            st.session_state._pending_scores = []
+        st.session_state._pending_scores.append([name, difficulty, clear_count, timestamp])
+        batch = st.session_state._pending_scores
+        st.session_state._pending_scores = []
+        # 書き込み待ちでUIをブロックしない。ランキングはttl=60のキャッシュ切れで追従する
+        threading.Thread(target=_flush_scores,
+                         args=(sheet, batch, st.session_state._pending_scores),
+                         daemon=True).start()
         st.toast("記録を保存しました！")
     except Exception as e:
         st.sidebar.warning(f"スコア保存エラー: {e}")
 
-def is_path_possible(game_map, start_pos, end_pos):
-    """BFS (幅優先探索) を使って、スタートからゴールまでの道があるかチェック"""
-    if not start_pos or not end_pos: return False
-    queue = deque([start_pos])
-    visited = {tuple(start_pos)}
-    
-    while queue:
-        x, y = queue.popleft()
-        if [x, y] == end_pos: return True
-        for dx, dy in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
-            nx, ny = x + dx, y + dy
-            if 0 <= ny < MAP_HEIGHT and 0 <= nx < MAP_WIDTH:
-                if tuple([nx, ny]) not in visited and game_map[ny][nx] != WALL:
-                    visited.add(tuple([nx, ny]))
-                    queue.append([nx, ny])
-    return False
-
 def generate_map(clear_count):
     """壁、鍵、障害物をランダムに配置し、クリア可能なマップを生成する"""
+    px, py = INITIAL_PLAYER_POS
+    ex, ey = EXIT_POS
     while True:
-        game_map = np.full((MAP_HEIGHT, MAP_WIDTH), FLOOR, dtype=str)
-        game_map[0, :] = WALL; game_map[-1, :] = WALL
-        game_map[:, 0] = WALL; game_map[:, -1] = WALL
-        possible_wall_positions = []
-        for y in range(1, MAP_HEIGHT - 1):
-            for x in range(1, MAP_WIDTH - 1):
-                 if [x, y] not in [INITIAL_PLAYER_POS, EXIT_POS]:
-                    possible_wall_positions.append([x, y])
-        
+        game_map = np.zeros((MAP_HEIGHT, MAP_WIDTH), dtype=np.uint8)
+        game_map[0, :] = WALL_ID; game_map[-1, :] = WALL_ID
+        game_map[:, 0] = WALL_ID; game_map[:, -1] = WALL_ID
+        # 空き床マスク。配置が決まるたびにその座標を消していき、全パスで使い回す
+        floor_mask = np.ones_like(game_map, dtype=bool)
+        floor_mask[0] = floor_mask[-1] = False
+        floor_mask[:, 0] = floor_mask[:, -1] = False
+        floor_mask[py, px] = floor_mask[ey, ex] = False
+
         num_walls = 30
-        if len(possible_wall_positions) >= num_walls:
-            wall_positions = random.sample(possible_wall_positions, num_walls)
-            for pos in wall_positions: game_map[pos[1]][pos[0]] = WALL
-
-        possible_key_positions = []
-        for y in range(1, MAP_HEIGHT - 1):
-            for x in range(1, MAP_WIDTH - 1):
-                if game_map[y][x] == FLOOR and [x,y] not in [INITIAL_PLAYER_POS, EXIT_POS]:
-                    possible_key_positions.append([x, y])
-        
-        if not possible_key_positions: continue
-        random.shuffle(possible_key_positions)
-        
-        key_pos = None
-        for pos in possible_key_positions:
-             if is_path_possible(game_map, INITIAL_PLAYER_POS, pos) and \
-                is_path_possible(game_map, pos, EXIT_POS):
-                key_pos = pos
-                break
-        
-        if key_pos: break
-            
-    possible_obstacle_positions = []
-    for y in range(1, MAP_HEIGHT - 1):
-        for x in range(1, MAP_WIDTH - 1):
-            if game_map[y][x] == FLOOR and [x, y] not in [INITIAL_PLAYER_POS, key_pos, EXIT_POS]:
-                possible_obstacle_positions.append([x, y])
-    
+        wall_coords = np.argwhere(floor_mask)  # (N, 2) の [y, x] 配列
+        if len(wall_coords) >= num_walls:
+            chosen = wall_coords[RNG.choice(len(wall_coords), size=num_walls, replace=False)]
+            game_map[chosen[:, 0], chosen[:, 1]] = WALL_ID
+            floor_mask[chosen[:, 0], chosen[:, 1]] = False
+
+        # 連結成分のラベリング1回で到達可能性をまとめて判定する
+        # (プレイヤー・鍵・出口が同じ成分にあれば、候補ごとのBFSは不要)
+        labels, _ = ndimage.label(game_map != WALL_ID)
+        player_label = labels[py, px]
+        if labels[ey, ex] != player_label: continue  # 出口に到達できない配置は作り直し
+        key_coords = np.argwhere(floor_mask & (labels == player_label))
+        if len(key_coords) == 0: continue
+        ky, kx = key_coords[RNG.integers(len(key_coords))]
+        key_pos = [int(kx), int(ky)]
+        break
+
+    floor_mask[key_pos[1], key_pos[0]] = False
+    obstacle_coords = np.argwhere(floor_mask)
+
     num_obstacles = min(clear_count, 40)
-    if num_obstacles > 0 and len(possible_obstacle_positions) >= num_obstacles:
-        obstacle_positions = random.sample(possible_obstacle_positions, num_obstacles)
-        for pos in obstacle_positions: game_map[pos[1]][pos[0]] = OBSTACLE
+    if num_obstacles > 0 and len(obstacle_coords) >= num_obstacles:
+        chosen = obstacle_coords[RNG.choice(len(obstacle_coords), size=num_obstacles, replace=False)]
+        game_map[chosen[:, 0], chosen[:, 1]] = OBSTACLE_ID
+        floor_mask[chosen[:, 0], chosen[:, 1]] = False
 
-    return game_map.tolist(), key_pos
+    return game_map, key_pos, floor_mask
 
 def initialize_game():
     """ゲームの状態を初期化する"""
@@ -138,16 +157,21 @@ def initialize_game():
             adjectives = ["勇敢な", "素早い", "賢い", "幸運の", "伝説の"]
             nouns = ["挑戦者", "冒険家", "探検家", "勇者", "脱出者"]
             today_str = time.strftime("%m%d")
-            random_name = f"{random.choice(adjectives)}{random.choice(nouns)}_{today_str}"
+            random_name = f"{RNG.choice(adjectives)}{RNG.choice(nouns)}_{today_str}"
             st.session_state.player_name = random_name
+            st.session_state.player_name_pending = random_name
 
-        game_map, key_pos = generate_map(st.session_state.clear_count)
+        game_map, key_pos, floor_mask = generate_map(st.session_state.clear_count)
         st.session_state.game_map = game_map
+        # 移動判定用の通行不可マスク。マップ生成時に1回だけ作る
+        st.session_state.player_blocked = (game_map == WALL_ID) | (game_map == OBSTACLE_ID)
+        st.session_state.oni_blocked = (game_map == WALL_ID)
+        st.session_state.render_scratch = np.empty_like(game_map)  # display_map用の使い回しバッファ
         st.session_state.key_pos = key_pos
         st.session_state.player_pos = list(INITIAL_PLAYER_POS)
         bottom_right_oni = [MAP_WIDTH - 2, MAP_HEIGHT - 2]
         bottom_left_oni = [1, MAP_HEIGHT - 2]
-        st.session_state.oni_pos = random.choice([bottom_right_oni, bottom_left_oni])
+        st.session_state.oni_pos = [bottom_right_oni, bottom_left_oni][RNG.integers(2)]
         st.session_state.exit_pos = list(EXIT_POS)
         st.session_state.has_key = False
         st.session_state.game_over = False
@@ -155,8 +179,8 @@ def initialize_game():
         st.session_state.message = "屋敷に閉じ込められた...。鍵を見つけて脱出しなければ。"
         st.session_state.win_counted = False
         st.session_state.game_started = True
-        st.session_state.start_time = time.time()
-        st.session_state.end_time = None
+        st.session_state.start_ns = time.monotonic_ns()
+        st.session_state.end_ns = None
         st.session_state.oni_last_move_time = time.time()
         
         st.session_state.player_trap_pos = None
@@ -167,162 +191,220 @@ def initialize_game():
 
         if st.session_state.difficulty == "むずかしい":
             st.session_state.trap_count = 1
-            possible_trap_positions = []
-            for y in range(1, MAP_HEIGHT - 1):
-                for x in range(1, MAP_WIDTH - 1):
-                    if st.session_state.game_map[y][x] == FLOOR and [x,y] not in [st.session_state.player_pos, st.session_state.oni_pos, st.session_state.key_pos, st.session_state.exit_pos]:
-                        possible_trap_positions.append([x, y])
-            if possible_trap_positions: st.session_state.map_trap_pos = random.choice(possible_trap_positions)
+            # generate_mapが使った空き床マスクをそのまま流用する (鍵・障害物は消去済み)
+            floor_mask[st.session_state.oni_pos[1], st.session_state.oni_pos[0]] = False
+            trap_coords = np.argwhere(floor_mask)
+            if len(trap_coords):
+                ty, tx = trap_coords[RNG.integers(len(trap_coords))]
+                st.session_state.map_trap_pos = [int(tx), int(ty)]
         else: st.session_state.trap_count = 0
 
 def display_map():
-    display_map_data = [row[:] for row in st.session_state.game_map]
-    px, py = st.session_state.player_pos
-    ox, oy = st.session_state.oni_pos
-    if st.session_state.player_trap_pos:
-        tx, ty = st.session_state.player_trap_pos
-        if [tx, ty] != [px, py] and [tx, ty] != [ox, oy]: display_map_data[ty][tx] = TRAP
-    if st.session_state.map_trap_pos:
-        tx, ty = st.session_state.map_trap_pos
-        if [tx, ty] != [px, py] and [tx, ty] != [ox, oy]: display_map_data[ty][tx] = TRAP
-    if st.session_state.key_pos:
-        kx, ky = st.session_state.key_pos
-        display_map_data[ky][kx] = KEY
-    ex, ey = st.session_state.exit_pos
-    display_map_data[py][px] = PLAYER
-    display_map_data[oy][ox] = ONI
-    exit_icon = EXIT_UNLOCKED if st.session_state.has_key else EXIT_LOCKED
-    display_map_data[ey][ex] = exit_icon
-    map_str = "\n".join(["".join(row) for row in display_map_data])
+    ss = st.session_state
+    # 毎フレーム新しい配列を確保せず、使い回しのバッファに1回のmemcpyで載せる
+    display_map_data = ss.render_scratch
+    np.copyto(display_map_data, ss.game_map)
+    px, py = ss.player_pos
+    ox, oy = ss.oni_pos
+    if ss.player_trap_pos:
+        tx, ty = ss.player_trap_pos
+        if [tx, ty] != [px, py] and [tx, ty] != [ox, oy]: display_map_data[ty, tx] = TRAP_ID
+    if ss.map_trap_pos:
+        tx, ty = ss.map_trap_pos
+        if [tx, ty] != [px, py] and [tx, ty] != [ox, oy]: display_map_data[ty, tx] = TRAP_ID
+    if ss.key_pos:
+        kx, ky = ss.key_pos
+        display_map_data[ky, kx] = KEY_ID
+    ex, ey = ss.exit_pos
+    display_map_data[py, px] = PLAYER_ID
+    display_map_data[oy, ox] = ONI_ID
+    exit_icon = EXIT_UNLOCKED_ID if ss.has_key else EXIT_LOCKED_ID
+    display_map_data[ey, ex] = exit_icon
+    rows = np.apply_along_axis("".join, 1, TILE_LUT[display_map_data])
+    map_str = "\n".join(rows)
     st.code(map_str, language=None)
 
 def move_player(dx, dy):
-    if st.session_state.game_over or st.session_state.win: return
-    px, py = st.session_state.player_pos
+    ss = st.session_state
+    if ss.game_over or ss.win: return
+    px, py = ss.player_pos
     new_px, new_py = px + dx, py + dy
-    if st.session_state.game_map[new_py][new_px] not in [WALL, OBSTACLE]:
-        st.session_state.player_pos = [new_px, new_py]
-        st.session_state.message = ""
+    if not ss.player_blocked[new_py, new_px]:
+        ss.player_pos = [new_px, new_py]
+        ss.message = ""
         check_events()
 
 def handle_bulk_move(commands):
+    ss = st.session_state
     for command in commands.lower():
-        if st.session_state.game_over or st.session_state.win: break
+        if ss.game_over or ss.win: break
         dx, dy = 0, 0
         if command == 'l': dx = -1
         elif command == 'r': dx = 1
         elif command == 'u': dy = -1
         elif command == 'd': dy = 1
         else: continue
-        px, py = st.session_state.player_pos
+        px, py = ss.player_pos
         new_px, new_py = px + dx, py + dy
-        if st.session_state.game_map[new_py][new_px] not in [WALL, OBSTACLE]:
-            st.session_state.player_pos = [new_px, new_py]
+        if not ss.player_blocked[new_py, new_px]:
+            ss.player_pos = [new_px, new_py]
             check_events()
         else:
-            st.session_state.message = "一括移動中に壁にぶつかり停止しました。"
+            ss.message = "一括移動中に壁にぶつかり停止しました。"
             break
             
-def _move_oni_one_step():
-    px, py = st.session_state.player_pos
-    ox, oy = st.session_state.oni_pos
+@njit(cache=True, boundscheck=False)
+def _bfs_next_step(blocked, ox, oy, px, py):
+    """鬼→プレイヤーの最短経路の最初の1マスを返す。到達不能なら(-1, -1)"""
+    h, w = blocked.shape
+    start = oy * w + ox
+    target = py * w + px
+    if start == target: return ox, oy
+    parent = np.full(h * w, -1, dtype=np.int32)
+    queue = np.empty(h * w, dtype=np.int32)
+    head = 0
+    tail = 1
+    queue[0] = start
+    parent[start] = start
+    while head < tail:
+        cur = queue[head]
+        head += 1
+        if cur == target: break
+        y = cur // w
+        x = cur - y * w
+        for k in range(4):
+            if k == 0: nx, ny = x, y + 1
+            elif k == 1: nx, ny = x, y - 1
+            elif k == 2: nx, ny = x + 1, y
+            else: nx, ny = x - 1, y
+            if 0 <= ny < h and 0 <= nx < w:
+                idx = ny * w + nx
+                if parent[idx] < 0 and not blocked[ny, nx]:
+                    parent[idx] = cur
+                    queue[tail] = idx
+                    tail += 1
+    if parent[target] < 0: return -1, -1
+    cur = target
+    while parent[cur] != start:
+        cur = parent[cur]
+    return cur - (cur // w) * w, cur // w
+
+def _greedy_step(blocked, ox, oy, px, py):
+    """壁1マス分しか見ない従来の貪欲移動。経路がないときの代替"""
     new_ox, new_oy = ox, oy
     dist_x, dist_y = px - ox, py - oy
-    impassable = [WALL]
     if abs(dist_x) > abs(dist_y):
-        if dist_x > 0 and st.session_state.game_map[oy][ox + 1] not in impassable: new_ox += 1
-        elif dist_x < 0 and st.session_state.game_map[oy][ox - 1] not in impassable: new_ox -= 1
-        elif dist_y > 0 and st.session_state.game_map[oy + 1][ox] not in impassable: new_oy += 1
-        elif dist_y < 0 and st.session_state.game_map[oy - 1][ox] not in impassable: new_oy -= 1
+        if dist_x > 0 and not blocked[oy, ox + 1]: new_ox += 1
+        elif dist_x < 0 and not blocked[oy, ox - 1]: new_ox -= 1
+        elif dist_y > 0 and not blocked[oy + 1, ox]: new_oy += 1
+        elif dist_y < 0 and not blocked[oy - 1, ox]: new_oy -= 1
     else:
-        if dist_y > 0 and st.session_state.game_map[oy + 1][ox] not in impassable: new_oy += 1
-        elif dist_y < 0 and st.session_state.game_map[oy - 1][ox] not in impassable: new_oy -= 1
-        elif dist_x > 0 and st.session_state.game_map[oy][ox + 1] not in impassable: new_ox += 1
-        elif dist_x < 0 and st.session_state.game_map[oy][ox - 1] not in impassable: new_ox -= 1
-    st.session_state.oni_pos = [new_ox, new_oy]
+        if dist_y > 0 and not blocked[oy + 1, ox]: new_oy += 1
+        elif dist_y < 0 and not blocked[oy - 1, ox]: new_oy -= 1
+        elif dist_x > 0 and not blocked[oy, ox + 1]: new_ox += 1
+        elif dist_x < 0 and not blocked[oy, ox - 1]: new_ox -= 1
+    return new_ox, new_oy
+
+def _move_oni_one_step():
+    ss = st.session_state
+    px, py = ss.player_pos
+    ox, oy = ss.oni_pos
+    # 最短経路の次の1マスへ。壁で隔絶されている場合だけ貪欲移動に落とす
+    new_ox, new_oy = _bfs_next_step(ss.oni_blocked, ox, oy, px, py)
+    if new_ox < 0:
+        new_ox, new_oy = _greedy_step(ss.oni_blocked, ox, oy, px, py)
+    ss.oni_pos = [new_ox, new_oy]
 
 def check_oni_trap_interaction():
-    oni_pos = st.session_state.oni_pos
+    ss = st.session_state
+    oni_pos = ss.oni_pos
     trapped = False
-    if st.session_state.player_trap_pos and oni_pos == st.session_state.player_trap_pos:
-        st.session_state.player_trap_pos = None; trapped = True
-    elif st.session_state.map_trap_pos and oni_pos == st.session_state.map_trap_pos:
-        st.session_state.map_trap_pos = None; trapped = True
+    if ss.player_trap_pos and oni_pos == ss.player_trap_pos:
+        ss.player_trap_pos = None; trapped = True
+    elif ss.map_trap_pos and oni_pos == ss.map_trap_pos:
+        ss.map_trap_pos = None; trapped = True
     if trapped:
-        st.session_state.oni_stopped_turns = 3
-        st.session_state.message = f"鬼が罠にかかった！ {st.session_state.oni_stopped_turns}ターン動けない。"
-        st.session_state.oni_last_move_time = time.time()
+        ss.oni_stopped_turns = 3
+        ss.message = f"鬼が罠にかかった！ {ss.oni_stopped_turns}ターン動けない。"
+        ss.oni_last_move_time = time.time()
 
 def move_oni():
-    if st.session_state.oni_freeze_end_time > time.time():
-        st.session_state.message = "鬼は鍵の力で動けない！"
+    ss = st.session_state
+    if ss.oni_freeze_end_time > time.time():
+        ss.message = "鬼は鍵の力で動けない！"
         return
-    if st.session_state.oni_stopped_turns > 0:
-        st.session_state.oni_stopped_turns -= 1
-        if st.session_state.oni_stopped_turns > 0:
-            st.session_state.message = f"鬼は罠にはまっている！あと{st.session_state.oni_stopped_turns}ターンは動けない。"
-        else: st.session_state.message = "鬼が罠から抜け出した！"
-        st.session_state.oni_last_move_time = time.time() # 停止ターン消費も1秒としてカウント
+    if ss.oni_stopped_turns > 0:
+        ss.oni_stopped_turns -= 1
+        if ss.oni_stopped_turns > 0:
+            ss.message = f"鬼は罠にはまっている！あと{ss.oni_stopped_turns}ターンは動けない。"
+        else: ss.message = "鬼が罠から抜け出した！"
+        ss.oni_last_move_time = time.time() # 停止ターン消費も1秒としてカウント
         return
 
-    difficulty = st.session_state.difficulty
+    difficulty = ss.difficulty
     if difficulty == "やさしい" or difficulty == "ふつう":
         _move_oni_one_step()
     elif difficulty == "むずかしい":
         _move_oni_one_step()
-        if st.session_state.player_pos == st.session_state.oni_pos: check_events(); return
+        if ss.player_pos == ss.oni_pos: check_events(); return
         _move_oni_one_step()
     check_oni_trap_interaction()
 
 def check_events():
-    if st.session_state.player_pos == st.session_state.oni_pos:
+    ss = st.session_state
+    if ss.player_pos == ss.oni_pos:
         # Repel Buff Check
-        if st.session_state.repel_charges > 0:
-            st.session_state.repel_charges -= 1
-            st.session_state.message = f"バリアが鬼を弾き飛ばした！(残り: {st.session_state.repel_charges}回)"
-            px, py = st.session_state.player_pos
-            ox, oy = st.session_state.oni_pos
-            dx = (ox - px) * 2 if (ox - px) != 0 else (random.choice([-1,1]) if ox==px else 0)
-            dy = (oy - py) * 2 if (oy - py) != 0 else (random.choice([-1,1]) if oy==py else 0)
-            st.session_state.oni_pos = [min(MAP_WIDTH - 2, max(1, ox + dx)), min(MAP_HEIGHT - 2, max(1, oy + dy))]
+        if ss.repel_charges > 0:
+            ss.repel_charges -= 1
+            ss.message = f"バリアが鬼を弾き飛ばした！(残り: {ss.repel_charges}回)"
+            px, py = ss.player_pos
+            ox, oy = ss.oni_pos
+            dx = (ox - px) * 2 if (ox - px) != 0 else ((1 if RNG.integers(2) else -1) if ox==px else 0)
+            dy = (oy - py) * 2 if (oy - py) != 0 else ((1 if RNG.integers(2) else -1) if oy==py else 0)
+            ss.oni_pos = [min(MAP_WIDTH - 2, max(1, ox + dx)), min(MAP_HEIGHT - 2, max(1, oy + dy))]
             return
             
-        st.session_state.game_over = True
-        st.session_state.message = "鬼に捕まってしまった...。"
-        if not st.session_state.end_time: st.session_state.end_time = time.time()
+        ss.game_over = True
+        ss.message = "鬼に捕まってしまった...。"
+        if not ss.end_ns: ss.end_ns = time.monotonic_ns()
         return
 
-    if st.session_state.key_pos and st.session_state.player_pos == st.session_state.key_pos:
-        st.session_state.has_key = True; st.session_state.key_pos = None
-        st.session_state.message = "鍵を手に入れた！出口を探そう。"
+    if ss.key_pos and ss.player_pos == ss.key_pos:
+        ss.has_key = True; ss.key_pos = None
+        ss.message = "鍵を手に入れた！出口を探そう。"
         # Freeze Buff Check
-        if st.session_state.clear_count >= 20 and random.random() < 0.05: # 条件変更
-            st.session_state.oni_freeze_end_time = time.time() + 10
-            st.session_state.message = "鍵の力で鬼の動きが10秒間止まった！"
+        if ss.clear_count >= 20 and RNG.random() < 0.05: # 条件変更
+            ss.oni_freeze_end_time = time.time() + 10
+            ss.message = "鍵の力で鬼の動きが10秒間止まった！"
         return
 
-    if st.session_state.player_pos == st.session_state.exit_pos:
-        if st.session_state.has_key:
-            st.session_state.win = True
-            st.session_state.message = "脱出に成功した！おめでとう！"
-            if not st.session_state.win_counted:
-                st.session_state.clear_count += 1
-                st.session_state.win_counted = True
+    if ss.player_pos == ss.exit_pos:
+        if ss.has_key:
+            ss.win = True
+            ss.message = "脱出に成功した！おめでとう！"
+            if not ss.win_counted:
+                ss.clear_count += 1
+                ss.win_counted = True
                 client = get_gspread_client()
                 if client:
-                    save_score(client, st.session_state.player_name, st.session_state.difficulty, st.session_state.clear_count)
-            if not st.session_state.end_time: st.session_state.end_time = time.time()
-        else: st.session_state.message = "鍵がかかっている...。鍵を探さなければ。"
+                    save_score(client, ss.player_name, ss.difficulty, ss.clear_count)
+            if not ss.end_ns: ss.end_ns = time.monotonic_ns()
+        else: ss.message = "鍵がかかっている...。鍵を探さなければ。"
+
+def oni_move_interval():
+    """難易度に応じた鬼の移動間隔(秒)を返す"""
+    ss = st.session_state
+    if ss.difficulty == 'やさしい': return 1.5
+    elif ss.difficulty == 'むずかしい': return 0.8
+    return 1.0
 
 def automatic_oni_move():
-    if st.session_state.game_over or st.session_state.win: return
-    interval = 1.0
-    if st.session_state.difficulty == 'やさしい': interval = 1.5
-    elif st.session_state.difficulty == 'むずかしい': interval = 0.8
-    if time.time() - st.session_state.oni_last_move_time > interval:
+    ss = st.session_state
+    if ss.game_over or ss.win: return
+    if time.time() - ss.oni_last_move_time > oni_move_interval():
         move_oni()
         check_events()
-        st.session_state.oni_last_move_time = time.time()
+        ss.oni_last_move_time = time.time()
 
 def force_game_reset():
     st.session_state.pop('game_started', None)
@@ -340,18 +422,22 @@ with st.sidebar:
     st.subheader("ランキング")
     gspread_client = get_gspread_client()
     if gspread_client:
-        ranking_df = get_ranking(gspread_client)
-        st.dataframe(ranking_df, hide_index=True)
+        ranking = get_ranking(gspread_client)
+        st.dataframe(ranking, hide_index=True)
     else:
         st.info("ランキング機能を利用するには、secrets.tomlの設定が必要です。")
 
     st.subheader("今回の名前")
-    st.text_input("名前", key="player_name", label_visibility="collapsed")
+    # フォームにまとめて、1文字ごとの再実行を防ぐ
+    with st.form("name_form", clear_on_submit=False):
+        st.text_input("名前", key="player_name_pending", label_visibility="collapsed")
+        if st.form_submit_button("名前を確定"):
+            st.session_state.player_name = st.session_state.player_name_pending
     st.write("---")
     
-    if 'start_time' in st.session_state:
-        elapsed_time = (st.session_state.end_time or time.time()) - st.session_state.start_time
-        minutes, seconds = int(elapsed_time // 60), int(elapsed_time % 60)
+    if 'start_ns' in st.session_state:
+        elapsed_s = ((st.session_state.end_ns or time.monotonic_ns()) - st.session_state.start_ns) // 1_000_000_000
+        minutes, seconds = divmod(elapsed_s, 60)
         st.write(f"**経過時間: {minutes:02d}:{seconds:02d}**")
     st.write("---")
     st.selectbox("難易度", ("やさしい", "ふつう", "むずかしい"), key='difficulty', 
@@ -364,8 +450,9 @@ with st.sidebar:
         st.write(f"**設置可能罠: {st.session_state.trap_count}**")
     st.write("---")
     st.write("**一括移動** (l:左, r:右, u:上, d:下)")
-    command_input = st.text_input("コマンド:", key="command_input", label_visibility="collapsed")
-    if st.button("一括移動を実行"): handle_bulk_move(command_input); st.rerun()
+    with st.form("bulk_move_form"):
+        command_input = st.text_input("コマンド:", key="command_input", label_visibility="collapsed")
+        if st.form_submit_button("一括移動を実行"): handle_bulk_move(command_input); st.rerun()
     st.write("---")
     with st.expander("ゲームのルール (Q&A)", expanded=False):
         st.markdown("""
@@ -421,6 +508,6 @@ st.write("")
 if st.button("リスタート", use_container_width=True): restart_game()
 
 # --- リアルタイム更新 ---
+# 鬼の移動間隔に合わせて再実行する (10Hzのsleep+rerunループは廃止)
 if not st.session_state.game_over and not st.session_state.win:
-    time.sleep(0.1)
-    st.rerun()
+    st_autorefresh(interval=int(oni_move_interval() * 1000), key="oni_tick")